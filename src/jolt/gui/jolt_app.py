@@ -23,7 +23,7 @@ import configparser
 from jolt import driver
 import jolt
 from jolt.gui import xmlh
-from jolt.util import log, call_in_wx_main
+from jolt.util import log, call_in_wx_main, call_in_wx_main_sync_ok
 import logging
 from logging.handlers import RotatingFileHandler
 import os
@@ -40,9 +40,6 @@ from pkg_resources import resource_filename, resource_stream
 # Start simulator if environment variable is set
 TEST_NOHW = (os.environ.get("TEST_NOHW", 0) != 0)  # Default to Hw testing
 
-# Set up logging
-logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.DEBUG)
-
 POLL_INTERVAL = 1.0  # seconds
 SAVE_CONFIG = True  # save configuration before closing
 STR2CHANNEL = {
@@ -82,6 +79,9 @@ class JoltApp(wx.App):
         self.warnings = set()
         self.error_codes = set()
         self.attrs_to_watch = {}  # empty dict
+        # True when a refresh is queued in the GUI thread but not yet run
+        self._refresh_pending = False
+        self._refresh_lock = threading.Lock()
 
         # Load configuration and logging files, create directories if they don't exist
         dirs = AppDirs("Jolt", "Delmic")
@@ -116,6 +116,7 @@ class JoltApp(wx.App):
             self.channel = "Pan"
         self.error = 8  # 8 means no error
         self.target_temp = 24
+        self._update_mppc_range()
         self.voltage_gui = self.voltage
         self.power = False
         self.hv = False
@@ -382,6 +383,17 @@ class JoltApp(wx.App):
         self.bmp_on = wx.Bitmap(wx.Image(resource_stream('jolt.gui', "img/icon_toggle_on.png")))
         self.bmp_icon = wx.Bitmap(wx.Image(resource_stream('jolt.gui', "img/icon_jolt.png")))
 
+        # The bitmap control should be greyed out. On linux, disabling the StaticBitmap does this
+        # automatically, however, on windows, this requires a bit more work. wx.Bitmap has a function
+        # .ConvertToDisabled(), but the resulting bitmap is almost transparent and can hardly be seen.
+        # Therefore we have to go the long way around and first convert the bitmap to an image, which
+        # can be converted to greyscale and then convert it back to a bitmap.
+        # It's done only once here, as the bitmaps are used at every refresh.
+        def disable_bmp(bmp):
+            return bmp.ConvertToImage().ConvertToGreyscale().ConvertToDisabled().ConvertToBitmap()
+        self.bmp_off_disabled = disable_bmp(self.bmp_off)
+        self.bmp_on_disabled = disable_bmp(self.bmp_on)
+
         # set icon
         icon = wx.Icon(self.bmp_icon)
         self.dialog.SetIcon(icon)
@@ -421,7 +433,7 @@ class JoltApp(wx.App):
         :param val: (float) a value
         :param srange: (float tuple) safe range
         :param name: (str) the name of the parameter used in the error message
-        :param t (float or None) current time. If specified, the function will only give an error
+        :param t (float or None) current time, as time.monotonic(). If specified, the function will only give an error
         if the value persists to be out of range after one minute.
         """
         textctrl.SetForegroundColour(wx.BLACK)
@@ -429,10 +441,9 @@ class JoltApp(wx.App):
             textctrl.SetForegroundColour((50, 210, 50))  # somewhat less bright than wx.GREEN
             if name in self.warnings:
                 self.warnings.remove(name)  # clear the warning if the error goes away
-            if name in self.attrs_to_watch:
-                del self.attrs_to_watch[name]
+            self.attrs_to_watch.pop(name, None)
         else:
-            if not t:
+            if t is None:
                 textctrl.SetForegroundColour(wx.RED)
                 # this way, the warning message is only displayed when the warning first occurs
                 if name not in self.warnings and not self.error_codes:  # don't show warning in case of error code, so it doesn't hide it
@@ -448,7 +459,7 @@ class JoltApp(wx.App):
             elif name not in self.attrs_to_watch:
                 # don't complain yet, but take notice
                 self.attrs_to_watch[name] = t
-            elif time.time() >= self.attrs_to_watch[name] + 60:
+            elif time.monotonic() >= self.attrs_to_watch[name] + 60:
                 textctrl.SetForegroundColour(wx.RED)
                 # this way, the warning message is only displayed when the warning first occurs
                 if name not in self.warnings and not self.error_codes: # don't show warning in case of error code, so it doesn't hide it
@@ -509,6 +520,7 @@ class JoltApp(wx.App):
                     self.target_temp = self.target_mppc_temp
             else:
                 self.target_temp = MPPC_TEMP_POWER_OFF
+            self._update_mppc_range()
             self.dev.set_target_mppc_temp(self.target_temp)
 
         # Turn voltage off if device is not powered on
@@ -521,6 +533,13 @@ class JoltApp(wx.App):
 
         self.refresh()
 
+    def _update_mppc_range(self):
+        """
+        Computes the safe range of the MPPC temperature, based on the target temperature.
+        To be called every time the target temperature changes.
+        """
+        self._mppc_range = (self.target_temp + self.mppc_temp_rel[0], self.target_temp + self.mppc_temp_rel[1])
+
     def on_voltage_button(self, event):
         """
         Enable/disable voltage changes. If disabled, set voltage to 0. 
@@ -587,19 +606,12 @@ class JoltApp(wx.App):
         logging.debug("Changed offset to %s", offset)
         self.txtbox_output.SetFocus()
 
-    @call_in_wx_main
+    @call_in_wx_main_sync_ok
     def update_controls(self):
         """
         Enable/disable the right controls, set bitmap controls and let the user know if we are in debug mode.
+        It only reflects the current state, so it's safe to run immediately when called from the GUI thread.
         """
-        def disable_bmp(bmp):
-            # The bitmap control should be greyed out. On linux, disabling the StaticBitmap does this
-            # automatically, however, on windows, this requires a bit more work. wx.Bitmap has a function
-            # .ConvertToDisabled(), but the resulting bitmap is almost transparent and can hardly be seen.
-            # Therefore we have to go the long way around and first convert the bitmap to an image, which
-            # can be converted to greyscale and then convert it back to a bitmap.
-            return bmp.ConvertToImage().ConvertToGreyscale().ConvertToDisabled().ConvertToBitmap()
-
         pressure_ok = self.saferange_vacuum_pressure[0] <= self.vacuum_pressure <= self.saferange_vacuum_pressure[1]
         heatsink_ok = self.saferange_sink_temp[0] <= self.heat_sink_temp <= self.saferange_sink_temp[1]
         if (self.debug_mode or self.power) and not self.error_codes:
@@ -620,7 +632,7 @@ class JoltApp(wx.App):
             self.ctl_power.Enable(True)
             self.ctl_hv.Enable(False)
             self.ctl_power.SetBitmap(self.bmp_on if self.power else self.bmp_off)
-            self.ctl_hv.SetBitmap(disable_bmp(self.bmp_on) if self.hv else disable_bmp(self.bmp_off))
+            self.ctl_hv.SetBitmap(self.bmp_on_disabled if self.hv else self.bmp_off_disabled)
             self.channel_ctrl.Enable(False)
             self.spinctrl_voltage.Enable(False)
             self.slider_gain.Enable(False)
@@ -631,8 +643,8 @@ class JoltApp(wx.App):
             # disable all
             self.ctl_power.Enable(False)
             self.ctl_hv.Enable(False)
-            self.ctl_power.SetBitmap(disable_bmp(self.bmp_on) if self.power else disable_bmp(self.bmp_off))
-            self.ctl_hv.SetBitmap(disable_bmp(self.bmp_on) if self.hv else disable_bmp(self.bmp_off))
+            self.ctl_power.SetBitmap(self.bmp_on_disabled if self.power else self.bmp_off_disabled)
+            self.ctl_hv.SetBitmap(self.bmp_on_disabled if self.hv else self.bmp_off_disabled)
             self.channel_ctrl.Enable(False)
             self.spinctrl_voltage.Enable(False)
             self.slider_gain.Enable(False)
@@ -653,6 +665,9 @@ class JoltApp(wx.App):
         """
         Refreshes the GUI display values
         """
+        # From now on, any new value requires a new refresh
+        self._refresh_pending = False
+
         # Check the error status
         if self.error != 8:
             if not self.error in self.error_codes:
@@ -669,101 +684,125 @@ class JoltApp(wx.App):
             # errors cleared
             self.error_codes.clear()
 
-        # Show settings for temperature, pressure etc
-        self.txtbox_output.SetValue("%.2f" % self.output)
-        self.txtbox_MPPCTemp.SetValue("%.1f" % self.mppc_temp)
-        self.txtbox_sinkTemp.SetValue("%.1f" % self.heat_sink_temp)
-        pressure_ok = self.saferange_vacuum_pressure[0] <= self.vacuum_pressure <= self.saferange_vacuum_pressure[1]
-        if pressure_ok:
-            self.txtbox_vacuumPressure.SetValue("vacuum")
-        else:
-            self.txtbox_vacuumPressure.SetValue("vented")
+        # Don't repaint the dialog after every change, but only once all the values are updated
+        self.dialog.Freeze()
+        try:
+            # Show settings for temperature, pressure etc
+            self.txtbox_output.SetValue("%.2f" % self.output)
+            self.txtbox_MPPCTemp.SetValue("%.1f" % self.mppc_temp)
+            self.txtbox_sinkTemp.SetValue("%.1f" % self.heat_sink_temp)
+            pressure_ok = self.saferange_vacuum_pressure[0] <= self.vacuum_pressure <= self.saferange_vacuum_pressure[1]
+            if pressure_ok:
+                self.txtbox_vacuumPressure.SetValue("vacuum")
+            else:
+                self.txtbox_vacuumPressure.SetValue("vented")
 
-        # Check ranges, create notification if necessary
-        self.check_saferange(self.txtbox_MPPCTemp, self.mppc_temp, [self.target_temp + self.mppc_temp_rel[0], self.target_temp + self.mppc_temp_rel[1]], "MPCC Temperature", time.time())
-        self.check_saferange(self.txtbox_sinkTemp, self.heat_sink_temp, self.saferange_sink_temp, "Heat Sink Temperature")
-        if not self.ambient:
-            # don't care about pressure in ambient mode
-            self.check_saferange(self.txtbox_vacuumPressure, self.vacuum_pressure, self.saferange_vacuum_pressure, "Vacuum Pressure")
+            # Check ranges, create notification if necessary
+            self.check_saferange(self.txtbox_MPPCTemp, self.mppc_temp, self._mppc_range, "MPCC Temperature", time.monotonic())
+            self.check_saferange(self.txtbox_sinkTemp, self.heat_sink_temp, self.saferange_sink_temp, "Heat Sink Temperature")
+            if not self.ambient:
+                # don't care about pressure in ambient mode
+                self.check_saferange(self.txtbox_vacuumPressure, self.vacuum_pressure, self.saferange_vacuum_pressure, "Vacuum Pressure")
 
-        # Modify controls to show hardware values
-        ch2sel = {"R": 0, "G": 1, "B": 2, "Pan": 3}
-        try:
-            self.channel_ctrl.SetSelection(ch2sel[self.channel])  # fails if it's Channel.NONE
-        except:
-            pass
-        self.slider_gain.SetValue(int(round(self.gain)))
-        self.slider_offset.SetValue(int(round(self.offset)))
-        # Don't refresh text controls that can be changed, it's annoying if you're trying to write
-        # Also don't update voltage control when voltage is off, we want to be able to easily turn the
-        # voltage on without readjusting the value.
-        # After entering a value, the focus will be automatically set to the output textbox, so there
-        # is a good chance that the textbox is going to be updated when we're not actively writing in it
-        # (this last point is implemented in the event callback functions).
-        focus = self.dialog.FindFocus()
-        # All controls will be disabled except the one that's in focus. However, on Windows,
-        # the FindFocus() returns a textcontrol object for the spincontrols, so it's not possible
-        # to compare them directly (bug in wxpython?). It turns out that the name of this textcontrol
-        # inside the spincontrol is always 'text', so we can test for that instead. The result is not
-        # perfect, we're now also not updating other spincontrols while typing in one, but
-        # this should not be a big issue for now.
-        try:
-            focus_name = focus.GetName()
-        except:
-            focus_name = ""
-        for ctrl, val in [(self.spinctrl_gain, self.gain), (self.spinctrl_offset, self.offset)]:
-            if focus != ctrl and focus_name != 'text':
-                ctrl.SetValue(round(float(val), 1))
-        if self.hv and focus != self.spinctrl_voltage and focus_name != 'text':
-            self.spinctrl_voltage.SetValue(round(float(self.voltage), 2))
-
-        # Grey out value in voltage control if voltage button is off.
-        # In this case, the actual voltage will be 0, but we still want the previous
-        # voltage to be shown, so it's easy to turn it back on again.
-        if self.hv:
-            self.spinctrl_voltage.SetForegroundColour(wx.BLACK)
-        elif not self.hv and focus != self.spinctrl_voltage and focus_name != 'text':
-            self.spinctrl_voltage.SetForegroundColour((211, 211, 211))  # light grey
-            # Colour is only updated if text is changed, so quickly change to value
-            # that is never reached (only in the gui of course) and back, so it's never
-            # noticed.
-            self.spinctrl_voltage.SetValue(100)
-            self.spinctrl_voltage.SetValue(self.voltage_gui)
+            # Modify controls to show hardware values
+            ch2sel = {"R": 0, "G": 1, "B": 2, "Pan": 3}
+            try:
+                self.channel_ctrl.SetSelection(ch2sel[self.channel])  # fails if it's Channel.NONE
+            except:
+                pass
+            self.slider_gain.SetValue(int(round(self.gain)))
+            self.slider_offset.SetValue(int(round(self.offset)))
+            # Don't refresh text controls that can be changed, it's annoying if you're trying to write
+            # Also don't update voltage control when voltage is off, we want to be able to easily turn the
+            # voltage on without readjusting the value.
+            # After entering a value, the focus will be automatically set to the output textbox, so there
+            # is a good chance that the textbox is going to be updated when we're not actively writing in it
+            # (this last point is implemented in the event callback functions).
+            focus = self.dialog.FindFocus()
+            # All controls will be disabled except the one that's in focus. However, on Windows,
+            # the FindFocus() returns a textcontrol object for the spincontrols, so it's not possible
+            # to compare them directly (bug in wxpython?). It turns out that the name of this textcontrol
+            # inside the spincontrol is always 'text', so we can test for that instead. The result is not
+            # perfect, we're now also not updating other spincontrols while typing in one, but
+            # this should not be a big issue for now.
+            try:
+                focus_name = focus.GetName()
+            except:
+                focus_name = ""
+            for ctrl, val in [(self.spinctrl_gain, self.gain), (self.spinctrl_offset, self.offset)]:
+                if focus != ctrl and focus_name != 'text':
+                    ctrl.SetValue(round(float(val), 1))
+            if self.hv and focus != self.spinctrl_voltage and focus_name != 'text':
+                self.spinctrl_voltage.SetValue(round(float(self.voltage), 2))
+
+            # Grey out value in voltage control if voltage button is off.
+            # In this case, the actual voltage will be 0, but we still want the previous
+            # voltage to be shown, so it's easy to turn it back on again.
+            if self.hv:
+                self.spinctrl_voltage.SetForegroundColour(wx.BLACK)
+            elif not self.hv and focus != self.spinctrl_voltage and focus_name != 'text':
+                self.spinctrl_voltage.SetForegroundColour((211, 211, 211))  # light grey
+                # Colour is only updated if text is changed, so quickly change to value
+                # that is never reached (only in the gui of course) and back, so it's never
+                # noticed.
+                self.spinctrl_voltage.SetValue(100)
+                self.spinctrl_voltage.SetValue(self.voltage_gui)
+        finally:
+            self.dialog.Thaw()
 
         # Update controls
         self.update_controls()
 
+    def _schedule_refresh(self):
+        """
+        Queue a refresh of the GUI, unless one is already queued. As the refresh
+        always displays the latest values, there is no need to queue more than one.
+        """
+        with self._refresh_lock:
+            if self._refresh_pending:
+                return
+            self._refresh_pending = True
+        self.refresh()
+
     def do_poll(self):
         """
         This function is run in a thread and handles the polling of the device on a time interval
         """
+        # Local references, to avoid looking them up at every iteration
+        should_close = self.should_close
+        schedule_refresh = self._schedule_refresh
+        logger = logging.getLogger()
         try:
-            while not self.should_close.is_set():
+            while not should_close.is_set():
+                # The device may be replaced (eg, by the tests), so only cache it per iteration
+                dev = self.dev
                 # Get new values from the device
                 if not self.differential:
-                    self.output = self.dev.get_output_single_ended()
+                    self.output = dev.get_output_single_ended()
                 else:
-                    self.output = self.dev.get_plus_reading_differential()
-                self.gain = self.dev.get_gain()
-                self.offset = self.dev.get_offset()
-                self.voltage = self.dev.get_voltage()
-                self.channel = CHANNEL2STR[self.dev.get_channel()]
-                self.mppc_temp = self.dev.get_cold_plate_temp()
-                self.heat_sink_temp = self.dev.get_hot_plate_temp()
-                self.vacuum_pressure = self.dev.get_vacuum_pressure()
-                self.error = self.dev.get_error_status()
-                self.itec = self.dev.get_itec()
-
-                logging.info("Gain: %.2f, offset: %.2f, channel: %s, temperature: %.2f, sink temperature: %.2f, " +
-                             "pressure: %.2f, voltage: %.2f, output: %.2f, error state: %d, Tec current: %s", self.gain, self.offset,
-                             self.channel, self.mppc_temp, self.heat_sink_temp, self.vacuum_pressure, self.voltage, self.output,
-                             self.error, self.itec)
+                    self.output = dev.get_plus_reading_differential()
+                self.gain = dev.get_gain()
+                self.offset = dev.get_offset()
+                self.voltage = dev.get_voltage()
+                self.channel = CHANNEL2STR[dev.get_channel()]
+                self.mppc_temp = dev.get_cold_plate_temp()
+                self.heat_sink_temp = dev.get_hot_plate_temp()
+                self.vacuum_pressure = dev.get_vacuum_pressure()
+                self.error = dev.get_error_status()
+                self.itec = dev.get_itec()
+
+                # Skip building the long argument list if it'd be discarded anyway
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Gain: %.2f, offset: %.2f, channel: %s, temperature: %.2f, sink temperature: %.2f, " +
+                                "pressure: %.2f, voltage: %.2f, output: %.2f, error state: %d, Tec current: %s", self.gain, self.offset,
+                                self.channel, self.mppc_temp, self.heat_sink_temp, self.vacuum_pressure, self.voltage, self.output,
+                                self.error, self.itec)
 
                 # Refresh gui with these values
-                self.refresh()
+                schedule_refresh()
 
-                # Wait till the next polling period
-                time.sleep(POLL_INTERVAL)
+                # Wait till the next polling period (or stop immediately on close)
+                should_close.wait(POLL_INTERVAL)
 
         except Exception as e:
             logging.exception(e)
@@ -833,6 +872,10 @@ def installThreadExcepthook():
 
 
 def main():
+    # Set up logging. Only done when running as the application, so that importing
+    # the module (eg, in the tests) doesn't change the logging configuration.
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.DEBUG)
+
     app = JoltApp()
     # Change exception hook so unexpected exception get caught by the logger,
     # and warnings are shown as warnings in the log.
@@ -26,9 +26,32 @@ import unittest
 from unittest.case import skip
 from jolt.driver.joltcb import JOLTComputerBoard, JOLTSimulator
 from jolt.gui.jolt_app import JoltApp
+import wx
 
 logging.getLogger().setLevel(logging.DEBUG)
 
+
+def wait_until(pred, timeout=5.0, interval=0.02):
+    """
+    Waits until a condition is fulfilled, while processing the pending wx events
+    (as the tests don't run the main loop, the GUI would otherwise never be updated)
+    :param pred: (callable -> bool) the condition to check
+    :param timeout: (float) maximum time to wait, in s
+    :param interval: (float) time between two checks, in s
+    :returns: (bool) True if the condition got fulfilled, False if it timed out
+    """
+    start = time.monotonic()
+    while True:
+        app = wx.GetApp()
+        if app:
+            app.ProcessPendingEvents()
+        if pred():
+            return True
+        if time.monotonic() - start >= timeout:
+            return False
+        time.sleep(interval)
+
+
 # TODO: testcases not working yet
 
 class TestSimulator(JOLTSimulator):
@@ -58,7 +81,10 @@ class JoltAppTest(unittest.TestCase):
     def setUpClass(cls):
          
         cls.app = JoltApp(simulated=True)
-        time.sleep(1)
+        # Wait for the first poll of the device
+        if not wait_until(lambda: hasattr(cls.app, "itec")):
+            cls.app.should_close.set()
+            raise AssertionError("No data polled from the device after 5 s")
  
     @classmethod
     def tearDownClass(cls):
@@ -79,13 +105,11 @@ class JoltAppTest(unittest.TestCase):
 
         # Power button disabled if pressure or hot plate temperature too high
         self.app.dev._serial.vacuum_pressure = 1000
-        time.sleep(1)
-        self.assertFalse(self.app.ctl_power.IsEnabled())
+        self.assertTrue(wait_until(lambda: not self.app.ctl_power.IsEnabled()))
 
         # Debug mode: all enabled, even if pressure too high
         self.app.debug_mode = True
-        time.sleep(1)
-        self.assertFalse(self.app.ctl_power.IsEnabled())
+        self.assertTrue(wait_until(lambda: not self.app.ctl_power.IsEnabled()))
          
         # Back to normal mode: allow turning off power (button not disabled if power is on)
         self.app.debug_mode = False
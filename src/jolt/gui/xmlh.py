@@ -26,6 +26,19 @@ DEFAULT_MIN = 0.0
 DEFAULT_MAX = 100.0
 DEFAULT_STEP = 1.0
 DEFAULT_INITIAL = 0.0
+DEFAULT_STYLE = wx.SP_ARROW_KEYS | wx.ALIGN_RIGHT | wx.TE_PROCESS_ENTER
+
+# Styles recognized in the XRC for a wxSpinCtrlDouble: XRC name -> wx style
+SPINCTRLDOUBLE_STYLES = (
+    ("wxSP_HORIZONTAL", wx.SP_HORIZONTAL),
+    ("wxSP_VERTICAL", wx.SP_VERTICAL),
+    ("wxSP_ARROW_KEYS", wx.SP_ARROW_KEYS),
+    ("wxSP_WRAP", wx.SP_WRAP),
+    ("wxALIGN_LEFT", wx.ALIGN_LEFT),
+    ("wxALIGN_CENTER", wx.ALIGN_CENTER),
+    ("wxALIGN_RIGHT", wx.ALIGN_RIGHT),
+    ("wxTE_PROCESS_ENTER", wx.TE_PROCESS_ENTER),
+)
 
 
 class SpinCtrlDoubleXmlHandler (xrc.XmlResourceHandler):
@@ -35,14 +48,8 @@ class SpinCtrlDoubleXmlHandler (xrc.XmlResourceHandler):
     def __init__(self):
         xrc.XmlResourceHandler.__init__(self)
         # Specify the styles recognized by objects of this type
-        self.AddStyle("wxSP_HORIZONTAL", wx.SP_HORIZONTAL)
-        self.AddStyle("wxSP_VERTICAL", wx.SP_VERTICAL)
-        self.AddStyle("wxSP_ARROW_KEYS", wx.SP_ARROW_KEYS)
-        self.AddStyle("wxSP_WRAP", wx.SP_WRAP)
-        self.AddStyle("wxALIGN_LEFT", wx.ALIGN_LEFT)
-        self.AddStyle("wxALIGN_CENTER", wx.ALIGN_CENTER)
-        self.AddStyle("wxALIGN_RIGHT", wx.ALIGN_RIGHT)
-        self.AddStyle("wxTE_PROCESS_ENTER", wx.TE_PROCESS_ENTER)
+        for name, style in SPINCTRLDOUBLE_STYLES:
+            self.AddStyle(name, style)
         self.AddWindowStyles()
 
     def CanHandle(self, node):
@@ -59,7 +66,7 @@ class SpinCtrlDoubleXmlHandler (xrc.XmlResourceHandler):
             self.GetText("value"),
             self.GetPosition(),
             self.GetSize(),
-            self.GetStyle("style", wx.SP_ARROW_KEYS | wx.ALIGN_RIGHT | wx.TE_PROCESS_ENTER),
+            self.GetStyle("style", DEFAULT_STYLE),
             self.GetFloat("min", DEFAULT_MIN),
             self.GetFloat("max", DEFAULT_MAX),
             self.GetFloat("initial", DEFAULT_INITIAL),  # Ignored if value contains a number
@@ -19,10 +19,12 @@ along with this program; if not, see http://www.gnu.org/licenses/.
 This module contains several util functions for wx Python GUI calls
 '''
 
-import queue
-from decorator import decorator
+import atexit
+import collections
 from functools import wraps
+import heapq
 import inspect
+import itertools
 import logging
 import threading
 import time
@@ -31,71 +33,182 @@ import wx
 import sys
 import os
 
-@decorator
-def call_in_wx_main(f, self, *args, **kwargs):
+# Set when Python is exiting. From then on, the wx.App is gone for good, so
+# there is no need to ask wx about it.
+_wx_app_dead = False
+
+
+def _on_exit():
+    global _wx_app_dead
+    _wx_app_dead = True
+
+
+atexit.register(_on_exit)
+
+# Calls waiting to be run in the main GUI thread, in order: (f, args, kwargs)
+_pending_calls = collections.deque()
+_pending_lock = threading.Lock()
+# wx.App to which _drain_pending_calls() is posted (and hasn't run yet), or None.
+# Only a drain posted to the current wx.App can be counted on: if the app has
+# ended, or was replaced, the drain will never run.
+_drain_app = None
+
+
+def _call_after(f, *args, **kwargs):
+    """
+    Same as wx.CallAfter(), but all the calls queued before the main GUI thread
+    gets to run them are handled by a single wx event.
+    """
+    global _drain_app
+    app = wx.GetApp()
+    with _pending_lock:
+        _pending_calls.append((f, args, kwargs))
+        if _drain_app is not None and _drain_app is app:
+            return  # The pending drain will run it
+        _drain_app = app
+
+    try:
+        wx.CallAfter(_drain_pending_calls)
+    except Exception:
+        # No way to run them (typically, because the wx.App is gone)
+        with _pending_lock:
+            _pending_calls.clear()
+            _drain_app = None
+        raise
+
+
+def _drain_pending_calls():
+    """
+    Runs (in the main GUI thread) all the calls queued by _call_after()
+    """
+    global _drain_app
+    # Calls queued from now on will post a new drain. So if one of the calls
+    # runs a nested event loop (eg, a modal dialog), that drain runs inside
+    # it, and continues from the oldest call left.
+    with _pending_lock:
+        _drain_app = None
+
+    while True:
+        with _pending_lock:
+            try:
+                f, args, kwargs = _pending_calls.popleft()
+            except IndexError:
+                return
+        try:
+            f(*args, **kwargs)
+        except Exception:
+            logging.exception("During call to %s() in the main GUI thread", f.__name__)
+
+
+def call_in_wx_main(f):
     """ This method decorator makes sure the method is called from the main
     (GUI) thread.
     The function will run asynchronously, so the function return value cannot
     be returned. So it's typically an error if a decorated function returns
     something useful.
     """
-    # We could try to be clever, and only run asynchronously if it's not called
-    # from the main thread, but that can cause anachronic issues. For example:
-    # 1. Call from another thread -> queued for later
-    # 2. Call from main thread -> immediately executed
-    # => Call 2 is executed before call 1, which could mean that an old value
-    # is displayed on the GUI.
-    # TODO: with Python 3, update that line to:
-    # if threading.current_thread() == threading.main_thread()
-#     if isinstance(threading.current_thread(), threading._MainThread):
-#         f(self, *args, **kwargs)
-#         return
-
-    wx.CallAfter(f, self, *args, **kwargs)
-
-def _li_thread(delay, q):
+    @wraps(f)
+    def call_in_wx_main_wrapzor(self, *args, **kwargs):
+        # We could try to be clever, and only run asynchronously if it's not called
+        # from the main thread, but that can cause anachronic issues. For example:
+        # 1. Call from another thread -> queued for later
+        # 2. Call from main thread -> immediately executed
+        # => Call 2 is executed before call 1, which could mean that an old value
+        # is displayed on the GUI.
+        _call_after(f, self, *args, **kwargs)
+
+    return call_in_wx_main_wrapzor
+
+
+def call_in_wx_main_sync_ok(f):
+    """ Same as call_in_wx_main, but if called from the main (GUI) thread,
+    the method is executed immediately, instead of being queued.
+    This skips a round-trip through the wx event queue, at the cost of the
+    ordering issue described in call_in_wx_main: the method can run before
+    calls queued earlier from other threads. So only use it on methods for
+    which this doesn't matter, typically the ones which only display the
+    latest state, independently of their arguments.
+    """
+    @wraps(f)
+    def call_in_wx_main_sync_ok_wrapzor(self, *args, **kwargs):
+        if wx.IsMainThread():
+            f(self, *args, **kwargs)
+        else:
+            _call_after(f, self, *args, **kwargs)
 
-    try:
-        exect = time.time()
-        while True:
-            # read the latest arguments in the queue (if there are more)
-            t, f, args, kwargs = q.get() # first wait until there is something
-            if t is None:
-                return
+    return call_in_wx_main_sync_ok_wrapzor
 
-            # wait until it's time for it
-            next_t = (min(exect, t) + delay)
-            while True: # discard arguments if there is newer calls already queued
-                sleep_t = next_t - time.time()
-                if sleep_t > 0:
-                    # logging.debug("waiting %f s until executing call", sleep_t)
-                    # time.sleep(sleep_t)
-                    timeout = sleep_t
-                    block = True
-                else: # just check one last time
-                    block = False
-                    timeout = None
-
-                try:
-                    t, f, args, kwargs = q.get(block=block, timeout=timeout)
-                    if t is None: # Sign that we should stop (object is gone)
-                        return
-                    # logging.debug("Overriding call with call at %f", t)
-                except queue.Empty:
-                    break
+class _LimitScheduler(object):
+    """
+    Runs the delayed calls of all the rate-limited methods, from a single thread.
+    For each method of each instance, at most one call is pending: a newer call
+    replaces the arguments of the pending one, and keeps its time.
+    """
 
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._deadlines = []  # heap of (time, order, key), earliest call first
+        self._order = itertools.count()  # to never have to compare the keys
+        self._calls = {}  # key -> (time, f, weakref to the instance, args, kwargs)
+        self._thread = None
+
+    def schedule(self, deadline, obj, f, args, kwargs):
+        """
+        Request a call to f(obj, *args, **kwargs).
+        :param deadline: (float) time (as time.monotonic()) at which to run the call.
+        :param obj: the instance. Only a weak reference is kept, so that a
+        pending call doesn't prevent it from being garbage collected.
+        :returns: (float) time at which the call will actually run. If a call
+        was already pending for this method and instance, that's its time.
+        """
+        key = (id(obj), f)
+        with self._cond:
             try:
-                exect = time.time()
-                # logging.debug("executing function %s with a delay of %f s", f.__name__, exect - t)
-                f(*args, **kwargs)
-            except Exception:
-                logging.exception("During limited invocation call")
+                deadline = self._calls[key][0]
+            except KeyError:
+                heapq.heappush(self._deadlines, (deadline, next(self._order), key))
+            self._calls[key] = (deadline, f, weakref.ref(obj), args, kwargs)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="li thread")
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
 
-            # clean up early, to avoid possible cyclic dep on the instance
-            del f, args, kwargs
+        return deadline
 
-    finally:
-        logging.debug("Ending li thread")
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    # wait until it's time for the earliest call
+                    while True:
+                        if not self._deadlines:
+                            self._cond.wait()
+                            continue
+                        sleep_t = self._deadlines[0][0] - time.monotonic()
+                        if sleep_t <= 0:
+                            break
+                        self._cond.wait(sleep_t)
+
+                    _, _, key = heapq.heappop(self._deadlines)
+                    _, f, wref, args, kwargs = self._calls.pop(key)
+
+                obj = wref()
+                if obj is not None:  # otherwise, the instance is gone => nothing to do
+                    try:
+                        f(obj, *args, **kwargs)
+                    except Exception:
+                        logging.exception("During limited invocation call")
+
+                # clean up early, to avoid possible cyclic dep on the instance
+                del obj, f, args, kwargs
+
+        finally:
+            logging.debug("Ending li thread")
+
+
+_li_scheduler = _LimitScheduler()
 
 def limit_invocation(delay_s):
     """ This decorator limits how often a method will be executed.
@@ -107,6 +220,9 @@ def limit_invocation(delay_s):
     Note that the method might be called in a separate thread. In wxPython, you
     might need to decorate it by @call_in_wx_main to ensure it is called in the GUI
     thread.
+    The instances must support weak references (ie, no __slots__ without
+    __weakref__), as a delayed call is dropped if its instance is gone. They
+    do not need to be hashable.
     """
 
     if delay_s > 5:
@@ -114,58 +230,61 @@ def limit_invocation(delay_s):
                      "an interval of 5 or less seconds")
 
     def li_dec(f):
-        # Share a lock on the class (as it's not easy on the instance)
-        # Note: we can only do this at init, after it's impossible to add/set
-        # attribute on an method
-        f._li_lock = threading.Lock()
-
-        # Hacky way to store value per instance and per methods
-        last_call_name = '%s_lim_inv_last_call' % f.__name__
-        queue_name = '%s_lim_inv_queue' % f.__name__
-        wr_name = '%s_lim_inv_wr' % f.__name__
+        # Only plain functions (ie, methods defined in a class), accepting the
+        # instance as first argument, are supported.
+        # Checked once here, instead of at every call.
+        if not inspect.isfunction(f):
+            raise ValueError("limit_invocation decorators should only be "
+                             "assigned to instance methods!")
+        params = list(inspect.signature(f).parameters.values())
+        if not params or params[0].kind not in (inspect.Parameter.POSITIONAL_ONLY,
+                                                inspect.Parameter.POSITIONAL_OR_KEYWORD,
+                                                inspect.Parameter.VAR_POSITIONAL):
+            raise ValueError("limit_invocation decorators should only be "
+                             "assigned to instance methods, but %s() has no "
+                             "positional argument" % (f.__name__,))
+
+        # Time of the last call, and lock, per instance. A lock per instance
+        # (instead of one for the method) avoids different instances waiting
+        # for each other. They are indexed by id(), so that the instances do
+        # not have to be hashable (eg, if they define __eq__ but not __hash__),
+        # and the entries are removed when the instance goes away, before its
+        # id can be reused.
+        last_calls = {}
+        locks = {}
+
+        def forget(key):
+            last_calls.pop(key, None)
+            locks.pop(key, None)
+
+        # Local references, as limit() is on the path of every call
+        _time = time.monotonic
 
         @wraps(f)
         def limit(self, *args, **kwargs):
-            if inspect.isclass(self):
-                raise ValueError("limit_invocation decorators should only be "
-                                 "assigned to instance methods!")
-
-            now = time.time()
-            with f._li_lock:
-                # If the function was called later than 'delay_s' seconds ago...
-                if (hasattr(self, last_call_name) and
-                    now - getattr(self, last_call_name) < delay_s):
+            now = _time()
+            key = id(self)
+            last_call = last_calls.get(key)
+            if last_call is None:
+                # First call for this instance
+                weakref.finalize(self, forget, key).atexit = False
+            elif now - last_call < delay_s:
+                with locks.setdefault(key, threading.Lock()):
                     # logging.debug('Delaying method call')
-                    try:
-                        q = getattr(self, queue_name)
-                    except AttributeError:
-                        # Create everything need
-                        q = queue.Queue()
-                        setattr(self, queue_name, q)
-
-                        # Detect when instance of self is dereferenced
-                        # and kill thread then
-                        def on_deref(obj):
-                            # logging.debug("object %r gone", obj)
-                            q.put((None, None, None, None)) # ask the thread to stop
-
-                        wref = weakref.ref(self, on_deref)
-                        setattr(self, wr_name, wref)
-
-                        t = threading.Thread(target=_li_thread,
-                                             name="li thread for %s" % f.__name__,
-                                             args=(delay_s, q))
-                        t.daemon = True
-                        t.start()
-
-                    q.put((now, f, (self,) + args, kwargs))
-                    setattr(self, last_call_name, now + delay_s)
-                    return
-                else:
-                    # execute method call now
-                    setattr(self, last_call_name, now)
+                    # Read again, as the time can only have moved later, if another
+                    # call was scheduled in the meantime.
+                    last_call = last_calls[key]
+                    # Run it 'delay_s' after the last call, or together with the
+                    # already pending call (but with these newer arguments).
+                    last_calls[key] = _li_scheduler.schedule(last_call + delay_s, self, f, args, kwargs)
+                return
 
+            # Not called within the last 'delay_s' seconds: execute method call now.
+            # That's the most common case, so it's done without the lock. At
+            # worst, two concurrent calls from different threads both run now.
+            last_calls[key] = now
             return f(self, *args, **kwargs)
+
         return limit
     return li_dec
 
@@ -174,9 +293,9 @@ def call_in_wx_main_wrapper(f):
     @wraps(f)
     def call_after_wrapzor(*args, **kwargs):
         try:
-            wx.CallAfter(f, *args, **kwargs)
+            _call_after(f, *args, **kwargs)
         except AssertionError:
-            if not wx.GetApp():
+            if _wx_app_dead or not wx.GetApp():
                 logging.info("Skipping call to %s() as wxApp is already ended", f.__name__)
             else:
                 raise
@@ -187,6 +306,8 @@ def dead_object_wrapper(f):
 
     @wraps(f)
     def dead_object_wrapzor(*args, **kwargs):
+        if _wx_app_dead:
+            return
         if not wx.GetApp():
             logging.info("Skipping call to %s() as wxApp is already ended", f.__name__)
             return
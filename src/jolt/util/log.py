@@ -39,6 +39,15 @@ class TextFieldHandler(logging.Handler):
         wx.TextAttr(FG_COLOUR_MAIN, None),
         wx.TextAttr(FG_COLOUR_DIS, None),
     )
+    # Style of the standard levels. Other levels: error style from ERROR upwards,
+    # dimmed style otherwise.
+    LEVEL_STYLES = {
+        logging.CRITICAL: TEXT_STYLES[0],
+        logging.ERROR: TEXT_STYLES[0],
+        logging.WARNING: TEXT_STYLES[1],
+        logging.INFO: TEXT_STYLES[2],
+        logging.DEBUG: TEXT_STYLES[3],
+    }
 
     def __init__(self):
         """ Call the parent constructor and initialize the handler """
@@ -48,26 +57,34 @@ class TextFieldHandler(logging.Handler):
         # queue of tuple (str, TextAttr) = text, style
         self._to_print = collections.deque(maxlen=LOG_LINES)
         self._print_lock = threading.Lock()
+        # length (in characters, including the line break) of each line in the text field
+        self._line_lengths = collections.deque()
 
     def setTextField(self, textfield):
         self.textfield = textfield
         self.textfield.Clear()
+        self._line_lengths.clear()
 
     def emit(self, record):
         """ Write a record, in colour, to a text field. """
         if self.textfield is not None:
-            if record.levelno >= logging.ERROR:
-                text_style = self.TEXT_STYLES[0]
-            elif record.levelno == logging.WARNING:
-                text_style = self.TEXT_STYLES[1]
-            elif record.levelno == logging.INFO:
-                text_style = self.TEXT_STYLES[2]
-            else:
-                text_style = self.TEXT_STYLES[3]
-
-            # Do the actual writing in a rate-limited thread, so logging won't
-            # interfere with the GUI drawing process.
-            self._to_print.append((record, text_style))
+            try:
+                try:
+                    text_style = self.LEVEL_STYLES[record.levelno]
+                except KeyError:
+                    if record.levelno >= logging.ERROR:
+                        text_style = self.TEXT_STYLES[0]
+                    else:
+                        text_style = self.TEXT_STYLES[3]
+
+                # Format the message now, in the thread of the caller, and do the
+                # actual writing in a rate-limited thread, so logging won't
+                # interfere with the GUI drawing process.
+                self._to_print.append((self.format(record), text_style))
+            except Exception:
+                # Like any handler, never let a logging error reach the caller
+                self.handleError(record)
+                return
             self.write_to_field()
 
     @wxlimit_invocation(0.2)
@@ -75,26 +92,36 @@ class TextFieldHandler(logging.Handler):
 
         with self._print_lock:
 
-            # Process the latest messages
+            # Process the latest messages. Consecutive messages with the same
+            # style are appended together, to limit the updates of the field.
+            prev_style = None
+            buf = []
             try:
-                prev_style = None
                 while True:
-                    record, text_style = self._to_print.popleft()
+                    msg, text_style = self._to_print.popleft()
                     if prev_style != text_style:
+                        if buf:
+                            self.textfield.AppendText("".join(buf))
+                            buf = []
                         self.textfield.SetDefaultStyle(text_style)
                         prev_style = text_style
-                    self.textfield.AppendText(self.format(record) + "\n")
+                    buf.append(msg + "\n")
+                    # A message can span multiple lines (eg, exception traceback)
+                    self._line_lengths.extend(len(l) + 1 for l in msg.split("\n"))
             except IndexError:
                 pass  # end of the queue
 
-            # Removes the characters from position 0 up to and including the Nth line break
-            nb_lines = self.textfield.GetNumberOfLines()
-            nb_old = nb_lines - LOG_LINES
+            if buf:
+                self.textfield.AppendText("".join(buf))
+
+            # Removes the characters from position 0 up to and including the Nth line break.
+            # The position is computed from the line lengths recorded when appending,
+            # which avoids copying the whole text of the field.
+            nb_old = len(self._line_lengths) - LOG_LINES
             if nb_old > 0:
                 first_new = 0
-                txt = self.textfield.Value
                 for i in range(nb_old):
-                    first_new = txt.find('\n', first_new) + 1
+                    first_new += self._line_lengths.popleft()
 
                 self.textfield.Remove(0, first_new)
 
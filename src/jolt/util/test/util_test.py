@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Created on 15 Oct 2026
+
+Copyright © 2026 Delmic
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+version 2 as published by the Free Software Foundation.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see http://www.gnu.org/licenses/.
+'''
+
+import gc
+import logging
+import time
+import unittest
+from jolt.util import limit_invocation
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+DELAY = 0.2  # s
+TIME_PRECISION = 0.05  # s, margin for the delayed calls to be run
+
+
+class Throttled(object):
+    """
+    Records when and with which arguments its method was actually run
+    """
+
+    def __init__(self, calls):
+        """
+        :param calls: (list) where to append the (time, value) of each call
+        """
+        self.calls = calls
+
+    @limit_invocation(DELAY)
+    def update(self, value):
+        self.calls.append((time.monotonic(), value))
+
+
+class Unhashable(Throttled):
+    """
+    Defines equality, so it is not hashable
+    """
+
+    def __eq__(self, other):
+        return isinstance(other, Unhashable)
+
+
+class TestLimitInvocation(unittest.TestCase):
+
+    def test_first_call(self):
+        """
+        The first call is run immediately
+        """
+        calls = []
+        obj = Throttled(calls)
+        start = time.monotonic()
+        obj.update(1)
+        self.assertEqual(len(calls), 1)
+        t, value = calls[0]
+        self.assertEqual(value, 1)
+        self.assertAlmostEqual(t, start, delta=TIME_PRECISION)
+
+    def test_collapse(self):
+        """
+        Calls within the delay are merged into one, with the latest arguments,
+        run 'delay' after the previous call
+        """
+        calls = []
+        obj = Throttled(calls)
+        obj.update(0)
+        for i in range(1, 5):
+            obj.update(i)
+        self.assertEqual(len(calls), 1)
+
+        time.sleep(DELAY + TIME_PRECISION)
+        self.assertEqual([v for t, v in calls], [0, 4])
+        self.assertAlmostEqual(calls[1][0] - calls[0][0], DELAY, delta=TIME_PRECISION)
+
+        # Next call is again delayed, 'delay' after the delayed call
+        obj.update(5)
+        time.sleep(DELAY + TIME_PRECISION)
+        self.assertEqual([v for t, v in calls], [0, 4, 5])
+        self.assertAlmostEqual(calls[2][0] - calls[1][0], DELAY, delta=TIME_PRECISION)
+
+    def test_independent_instances(self):
+        """
+        Each instance is throttled on its own
+        """
+        calls_a, calls_b = [], []
+        obj_a = Throttled(calls_a)
+        obj_b = Throttled(calls_b)
+        obj_a.update(1)
+        obj_b.update(10)
+        # Both first calls run immediately, despite sharing the same method
+        self.assertEqual([v for t, v in calls_a], [1])
+        self.assertEqual([v for t, v in calls_b], [10])
+
+        obj_a.update(2)
+        obj_b.update(20)
+        obj_b.update(21)
+        time.sleep(DELAY + TIME_PRECISION)
+        self.assertEqual([v for t, v in calls_a], [1, 2])
+        self.assertEqual([v for t, v in calls_b], [10, 21])
+
+    def test_unhashable(self):
+        """
+        Instances which are not hashable are also supported, and equal
+        instances are still throttled independently
+        """
+        calls_a, calls_b = [], []
+        obj_a = Unhashable(calls_a)
+        obj_b = Unhashable(calls_b)
+        obj_a.update(1)
+        obj_b.update(10)
+        obj_a.update(2)
+        time.sleep(DELAY + TIME_PRECISION)
+        self.assertEqual([v for t, v in calls_a], [1, 2])
+        self.assertEqual([v for t, v in calls_b], [10])
+
+    def test_gc_drops_pending(self):
+        """
+        A pending call is not run if its instance has been garbage-collected
+        """
+        calls = []
+        obj = Throttled(calls)
+        obj.update(1)
+        obj.update(2)  # delayed
+        del obj
+        gc.collect()
+
+        time.sleep(DELAY + TIME_PRECISION)
+        self.assertEqual([v for t, v in calls], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()